@@ -121,11 +121,12 @@ class DataNormalisation(BaseNormaliser):
 
         # Determine variable names from regular expressions. The given expressions are matched starting from the first
         # character in the variable name and ending at the end of the name, rather than being matched anywhere in it.
-        # This ensures that something like Var_1 will match only Var_1 and not Var_11 etc.
+        # This ensures that something like Var_1 will match only Var_1 and not Var_11 etc. Each expression is grouped
+        # before being anchored so that the anchor applies to all alternatives within an expression (e.g. Var_1|Var_2).
         if nameRegexps:
             # Only bother if there are some names given.
-            regex = re.compile('|'.join(["{:s}$".format(i) for i in nameRegexps]))
-            variablesNames.update({i for i in self._header if regex.match(i)})
+            regex = re.compile('|'.join(["(?:{:s})$".format(i) for i in nameRegexps]))
+            variablesNames.update(filter(regex.match, self._header))
 
         return variablesNames
 
@@ -166,18 +167,30 @@ class BOWNormaliser(DataNormalisation):
             else:
                 self._normalisers[i] = baseNormaliser
 
-        # Setup the normaliser functions.
-        with open(fileDataset, 'r') as fidDataset:
-            # Strip the header if there is one.
-            if self._headerPresent:
-                fidDataset.readline()
+        # Only the normalisers of variables that are being normalised record anything when updated, so only they need
+        # to see the variable values in the dataset.
+        updateFuncs = {
+            i: j.update for i, j in self._normalisers.items() if j is not baseNormaliser and j is not ignoreVarNorm
+        }
 
-            # Go through the datapoints and update the record for each normaliser function.
-            for line in fidDataset:
-                variables = (line.strip()).split(self._separator)
-                for i in variables:
-                    varName, varVal = i.split(':')
-                    self._normalisers[varName].update(varVal)
+        # Setup the normaliser functions.
+        if updateFuncs:
+            with open(fileDataset, 'r') as fidDataset:
+                # Strip the header if there is one.
+                if self._headerPresent:
+                    fidDataset.readline()
+
+                # Go through the datapoints and update the record for each normaliser function.
+                for line in fidDataset:
+                    variables = (line.strip()).split(self._separator)
+                    for i in variables:
+                        varName, varVal = i.split(':')
+                        if varName in updateFuncs:
+                            updateFuncs[varName](varVal)
+
+        # Finalise the normalisation parameters now that the whole dataset has been seen.
+        for i in self._normalisers.values():
+            i.finalise()
 
         # Determine new variable indices.
         self._keptVariables = {}
@@ -251,16 +264,33 @@ class VectorNormaliser(DataNormalisation):
             else:
                 self._normalisers[i] = baseNormaliser
 
-        # Setup the normaliser functions.
-        with open(fileDataset, 'r') as fidDataset:
-            # Strip the header if there is one.
-            if self._headerPresent:
-                fidDataset.readline()
+        # Bind the functions of each variable's normaliser in variable order. This allows a datapoint to be processed by
+        # zipping its values with the functions, rather than looking up each variable's normaliser for every value.
+        self._normaliseFuncs = [self._normalisers[i].normalise for i in range(len(self._header))]
+
+        # Only the normalisers of variables that are being normalised record anything when updated, so only they need
+        # to see the variable values in the dataset.
+        updateFuncs = [
+            (i, self._normalisers[i].update) for i in range(len(self._header))
+            if self._normalisers[i] is not baseNormaliser and self._normalisers[i] is not ignoreVarNorm
+        ]
 
-            # Go through the datapoints and update the record for each normaliser function.
-            for line in fidDataset:
-                for i, j in enumerate((line.strip()).split(self._separator)):
-                    self._normalisers[i].update(j)
+        # Setup the normaliser functions.
+        if updateFuncs:
+            with open(fileDataset, 'r') as fidDataset:
+                # Strip the header if there is one.
+                if self._headerPresent:
+                    fidDataset.readline()
+
+                # Go through the datapoints and update the record for each normaliser function.
+                for line in fidDataset:
+                    values = (line.strip()).split(self._separator)
+                    for i, updateFunc in updateFuncs:
+                        updateFunc(values[i])
+
+        # Finalise the normalisation parameters now that the whole dataset has been seen.
+        for i in self._normalisers.values():
+            i.finalise()
 
     def normalise(self, datapoint):
         """Normalise a datapoint's values.
@@ -272,8 +302,14 @@ class VectorNormaliser(DataNormalisation):
 
         """
 
+        # Zipping would silently drop any values beyond the number of variables, so reject such datapoints in the same
+        # way as looking up a normaliser for a variable that doesn't exist.
+        if len(datapoint) > len(self._normaliseFuncs):
+            raise KeyError(len(self._normaliseFuncs))
+
         normalisedDatapoint = []
-        for i, j in enumerate(datapoint):
-            normalisedDatapoint.extend(self._normalisers[i].normalise(j))
+        extendDatapoint = normalisedDatapoint.extend
+        for normaliseFunc, value in zip(self._normaliseFuncs, datapoint):
+            extendDatapoint(normaliseFunc(value))
 
         return normalisedDatapoint
@@ -8,6 +8,11 @@ import sys
 class BaseNormalisation(object):
     """Base normalisation class."""
 
+    def finalise(self):
+        """Finalise the parameters used for the normalisation once all updates have been made."""
+
+        pass
+
     def normalise(self, value):
         """Normalise a variable that is meant to be unchanged.
 
@@ -31,15 +36,48 @@ class BaseNormalisation(object):
         pass
 
 
+class AffineNorm(BaseNormalisation):
+    """Class for normalising numeric variables by shifting and scaling them."""
+
+    def __init__(self):
+        """Initialise an affine normaliser."""
+
+        self._centre = 0.0
+        self._scale = 1.0
+
+    def normalise(self, value):
+        """Normalise a variable that is meant to be shifted and scaled.
+
+        :param value:   The value to normalise.
+        :type value:    str
+        :return:        The normalised value.
+        :rtype:         list
+
+        """
+
+        return [(float(value) - self._centre) / self._scale]
+
+
 class CategoricalNorm(BaseNormalisation):
     """Class for normalising categorical variables."""
 
     def __init__(self):
         """Initialise a one-of-C normaliser."""
 
+        self._encodings = {}
         self._valueCount = 0
         self._valueMapping = {}
 
+    def finalise(self):
+        """Finalise the parameters used for the normalisation once all updates have been made.
+
+        As there are only a few categories, the normalised value of each is determined once here rather than every
+        time a value is normalised.
+
+        """
+
+        self._encodings = {i: self._encode(i) for i in self._valueMapping}
+
     def get_categories(self):
         """Get the categories that the variable takes.
 
@@ -60,6 +98,22 @@ class CategoricalNorm(BaseNormalisation):
 
         return self._valueCount if self._valueCount > 2 else 1
 
+    def normalise(self, value):
+        """Normalise a variable that is meant to be categorically normalised.
+
+        :param value:   The value to normalise.
+        :type value:    str
+        :return:        The normalised value.
+        :rtype:         list
+
+        """
+
+        try:
+            return self._encodings[value]
+        except KeyError:
+            # The value is a category that wasn't seen when the normaliser was updated.
+            return self._encode(value)
+
     def update(self, value):
         """Update the parameters used for the normalisation.
 
@@ -89,27 +143,21 @@ class IgnoreVariable(BaseNormalisation):
         return []
 
 
-class MinMaxNorm(BaseNormalisation):
-    """Class for performing min max normalisation."""
+class MinMaxNorm(AffineNorm):
+    """Class for performing min max normalisation to the range [-1, 1]."""
 
     def __init__(self):
         """Initialise a min-max normaliser."""
 
+        super(MinMaxNorm, self).__init__()
         self._min = sys.maxsize
         self._max = -sys.maxsize
 
-    def normalise(self, value):
-        """Normalise a variable that is meant to be min-max normalised to the range [-1, 1].
-
-        :param value:   The value to normalise.
-        :type value:    str
-        :return:        The normalised value.
-        :rtype:         list
+    def finalise(self):
+        """Finalise the parameters used for the normalisation once all updates have been made."""
 
-        """
-
-        value = float(value)
-        return [(value - ((self._max + self._min) / 2)) / ((self._max - self._min) / 2)]
+        self._centre = (self._max + self._min) / 2
+        self._scale = (self._max - self._min) / 2
 
     def update(self, value):
         """Update the parameters used for the normalisation.
@@ -127,10 +175,10 @@ class MinMaxNorm(BaseNormalisation):
 class OneOfC(CategoricalNorm):
     """Class for performing one-of-C normalisation."""
 
-    def normalise(self, value):
-        """Normalise a variable that is meant to be one-of-C normalised.
+    def _encode(self, value):
+        """Encode a value of a variable that is meant to be one-of-C normalised.
 
-        :param value:   The value to normalise.
+        :param value:   The value to encode.
         :type value:    str
         :return:        The one-of-C normalised value.
         :rtype:         list
@@ -148,10 +196,10 @@ class OneOfC(CategoricalNorm):
 class OneOfCMin1(CategoricalNorm):
     """Class for performing one-of-(C-1) normalisation."""
 
-    def normalise(self, value):
-        """Normalise a variable that is meant to be one-of-(C-1) normalised.
+    def _encode(self, value):
+        """Encode a value of a variable that is meant to be one-of-(C-1) normalised.
 
-        :param value:   The value to normalise.
+        :param value:   The value to encode.
         :type value:    str
         :return:        The one-of-(C-1) normalised value.
         :rtype:         list
@@ -166,29 +214,23 @@ class OneOfCMin1(CategoricalNorm):
             return [(1 if i == value else -1) for i in sorted(self._valueMapping)[:-1]]
 
 
-class Standardisation(BaseNormalisation):
+class Standardisation(AffineNorm):
     """Class for performing standardisation."""
 
     def __init__(self):
         """Initialise a standardisation normaliser."""
 
+        super(Standardisation, self).__init__()
         self._mean = 0.0
         self._num = 0
         self._sumDiffs = 0.0
 
-    def normalise(self, value):
-        """Normalise a variable that is meant to be standardised.
+    def finalise(self):
+        """Finalise the parameters used for the normalisation once all updates have been made."""
 
-        :param value:   The value to normalise.
-        :type value:    str
-        :return:        The standardised value.
-        :rtype:         list
-
-        """
-
-        value = float(value)
-        variance = self._sumDiffs / (self._num - 1)
-        return [(value - self._mean) / math.sqrt(variance)]
+        self._centre = self._mean
+        # The variance is undefined with fewer than two values, so use a scale that will fail when normalising.
+        self._scale = math.sqrt(self._sumDiffs / (self._num - 1)) if self._num > 1 else 0.0
 
     def update(self, value):
         """Update the parameters used for the normalisation.
@@ -1,20 +1,44 @@
 """Code to shard a large dataset file into multiple small ones."""
 
 # Python imports.
+import collections
+import functools
+import itertools
 import json
+import locale
 import logging
+import mmap
+import multiprocessing
 import os
-import random
+import struct
 import sys
 
 # User imports.
 from . import DataNormalisation
 
 # 3rd party imports.
+import numpy as np
 import tensorflow as tf
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
 
 # Globals.
 LOGGER = logging.getLogger(__name__)
+READ_BUFFER_SIZE = 1 << 20  # The number of bytes of the input files to split into lines at a time.
+WRITE_BUFFER_SIZE = 4 << 20  # The number of bytes of records to buffer before writing them to a TFRecord file.
+SERIALISE_CHUNK_SIZE = 1000  # The number of lines to normalise and serialise at once.
+SPLIT_CHUNK_SIZE = 4096  # The number of examples to determine the dataset portion of at once.
+_RECORD_CRC_STRUCT = struct.Struct("<I")  # The format of the masked CRC32C checksums in a TFRecord.
+_RECORD_LENGTH_STRUCT = struct.Struct("<Q")  # The format of the length of a record in a TFRecord.
+_FEATURE_NAME_PREFIXES = {}  # The serialised name fields of the features in the Example protocol buffers.
+_IS_CRC32C_COMPILED = bool(google_crc32c) and google_crc32c.implementation == "c"  # Whether records can be framed here.
+_FIELD_1_TAG = b"\x0a"  # The tag of a length-delimited protocol buffer field with field number 1.
+_FIELD_2_TAG = b"\x12"  # The tag of a length-delimited protocol buffer field with field number 2.
+_FIELD_3_TAG = b"\x1a"  # The tag of a length-delimited protocol buffer field with field number 3.
+_SINGLE_BYTE_VARINTS = [bytes(bytearray([i])) for i in range(0x80)]  # The encodings of the integers 0-127 as varints.
+_WORKER_SERIALISE = None  # The function used by a worker process to serialise lines of examples and targets.
 
 # Define functions for compatibility.
 if sys.version_info[0] >= 3:
@@ -71,12 +95,10 @@ def shard_vector(fileExamples, dirOutput, config, fileTargets=None):
 
     """
 
-    # Seed the random number generator.
+    # Seed the random number generator. numpy only accepts seeds in [0, 2**32), so the (unbounded) configured seed is
+    # reduced into that range.
     randomSeed = config.get_param(["RandomSeed"])
-    if randomSeed[0]:
-        random.seed(randomSeed[1])
-    else:
-        random.seed(None)
+    randomState = np.random.RandomState(randomSeed[1] % (2 ** 32) if randomSeed[0] else None)
 
     # Determine the examples that will be used for training, testing and validation. Pad the
     # configuration parameters with 0s so that missing test and validation fraction values mean that there are no
@@ -87,6 +109,7 @@ def shard_vector(fileExamples, dirOutput, config, fileTargets=None):
     testFraction = min(1 - trainFraction, datasetDivisions[1])
     validationFraction = min(1 - (trainFraction + testFraction), datasetDivisions[2])
     choices = [trainFraction, trainFraction + testFraction, trainFraction + testFraction + validationFraction]
+    splits = _generate_splits(choices, randomState)
 
     # Create the example data normaliser.
     LOGGER.info("Now creating example data normaliser.")
@@ -108,133 +131,109 @@ def shard_vector(fileExamples, dirOutput, config, fileTargets=None):
         targetNormaliser = DataNormalisation.BaseNormaliser()
 
     # Setup the files to record the data in.
+    if _IS_CRC32C_COMPILED:
+        LOGGER.info("Writing TFRecord files through a buffered writer using the compiled google_crc32c checksums.")
+    else:
+        LOGGER.info("Writing TFRecord files with TensorFlow's writer as the compiled google_crc32c isn't available.")
     dirTrainData = os.path.join(dirOutput, "TrainingData")
     os.makedirs(dirTrainData)
     examplesAddedToShard = 0  # The number of examples added to the current shard.
     currentFileNumber = 0
-    fidTrainingShard = tf.python_io.TFRecordWriter(os.path.join(dirTrainData, "Shard_{:d}".format(currentFileNumber)))
-    fidTest = tf.python_io.TFRecordWriter(os.path.join(dirOutput, "Test"))
-    fidValidation = tf.python_io.TFRecordWriter(os.path.join(dirOutput, "Validation"))
+    fidTrainingShard = _open_record_writer(os.path.join(dirTrainData, "Shard_{:d}".format(currentFileNumber)))
+    fidTest = _open_record_writer(os.path.join(dirOutput, "Test"))
+    fidValidation = _open_record_writer(os.path.join(dirOutput, "Validation"))
 
-    # Write out the examples and targets.
-    LOGGER.info("Now writing out TFRecord files.")
-    examplesPerShard = config.get_param(["DataProcessing", "ExamplesPerShard"])[1]  # Examples to put in a shard.
+    # Setup the normalisation and serialisation of the examples and targets. This is done in chunks of lines, with the
+    # chunks being farmed out to a pool of worker processes if more than one process is to be used.
     exampleSeparator = config.get_param(["DataProcessing", "Examples", "Separator"])[1]
     exampleHeaderPresent = config.get_param(["DataProcessing", "Examples", "HeaderPresent"])[1]
     targetSeparator = config.get_param(["DataProcessing", "Targets", "Separator"])[1]
     targetHeaderPresent = config.get_param(["DataProcessing", "Targets", "HeaderPresent"])[1]
-    with open(fileExamples, 'r') as fidExamples, open(fileTargets if fileTargets else os.devnull, 'r') as fidTargets:
-        # Strip headers.
-        if exampleHeaderPresent:
-            fidExamples.readline()
-        if targetHeaderPresent:
-            fidTargets.readline()
-
-        for i, j in izip_longest(fidExamples, fidTargets, fillvalue=''):
-            # Normalise the data.
-            exampleDatapoint = exampleNormaliser.normalise((i.strip()).split(exampleSeparator))
-            targetDatapoint = [] if not fileTargets else targetNormaliser.normalise((j.strip()).split(targetSeparator))
-
-            # Determine what dataset portion this example/target should go to.
-            choice = random.random()
-            choice = [choice < i for i in choices]
-            if choice[0]:
-                # The example/target will go to the training set.
-
-                # Create the Example protocol buffer
-                # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/example.proto).
-                example = tf.train.Example(
-                    # The Example protocol buffer contains a Features protocol buffer
-                    # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/feature.proto).
-                    features=tf.train.Features(
-                        # The Features protocol buffer contains a list of features, which are one of either a
-                        # bytes_list, float_list or int64_list.
-                        feature={
-                            "Example": _float_feature(exampleDatapoint[2] if isExamplesBOW else exampleDatapoint),
-                            "ExampleIndices": _int64_feature(exampleDatapoint[1] if isExamplesBOW else []),
-                            "NumExampleVars": _int64_feature(
-                                [exampleDatapoint[0]] if isExamplesBOW else [len(exampleDatapoint)]
-                            ),
-                            "Target": _float_feature(targetDatapoint[2] if isTargetsBOW else targetDatapoint),
-                            "TargetIndices": _int64_feature(targetDatapoint[1] if isTargetsBOW else []),
-                            "NumTargetVars": _int64_feature(
-                                [targetDatapoint[0]] if isTargetsBOW else [len(targetDatapoint)]
-                            )
-                        }
-                    )
-                )
-                fidTrainingShard.write(example.SerializeToString())
-                examplesAddedToShard += 1
-
-                # Open a new shard file if needed.
-                if examplesAddedToShard == examplesPerShard:
-                    fidTrainingShard.close()
-                    examplesAddedToShard = 0
-                    currentFileNumber += 1
-                    fidTrainingShard = tf.python_io.TFRecordWriter(
-                        os.path.join(dirTrainData, "Shard_{:d}".format(currentFileNumber))
-                    )
-            elif choice[1]:
-                # The example/target will go to the test set.
-
-                # Create the Example protocol buffer
-                # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/example.proto).
-                example = tf.train.Example(
-                    # The Example protocol buffer contains a Features protocol buffer
-                    # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/feature.proto).
-                    features=tf.train.Features(
-                        # The Features protocol buffer contains a list of features, which are one of either a
-                        # bytes_list, float_list or int64_list.
-                        feature={
-                            "Example": _float_feature(exampleDatapoint[2] if isExamplesBOW else exampleDatapoint),
-                            "ExampleIndices": _int64_feature(exampleDatapoint[1] if isExamplesBOW else []),
-                            "NumExampleVars": _int64_feature(
-                                [exampleDatapoint[0]] if isExamplesBOW else [len(exampleDatapoint)]
-                            ),
-                            "Target": _float_feature(targetDatapoint[2] if isTargetsBOW else targetDatapoint),
-                            "TargetIndices": _int64_feature(targetDatapoint[1] if isTargetsBOW else []),
-                            "NumTargetVars": _int64_feature(
-                                [targetDatapoint[0]] if isTargetsBOW else [len(targetDatapoint)]
+    serialise = functools.partial(
+        _serialise_lines, exampleNormaliser=exampleNormaliser, exampleSeparator=exampleSeparator,
+        isExamplesBOW=isExamplesBOW, targetNormaliser=targetNormaliser if fileTargets else None,
+        targetSeparator=targetSeparator, isTargetsBOW=isTargetsBOW
+    )
+    numberProcesses = config.get_param(["DataProcessing", "NumberProcesses"])
+    numberProcesses = numberProcesses[1] if numberProcesses[0] else 1
+    pool = multiprocessing.Pool(numberProcesses, _initialise_worker, (serialise,)) if numberProcesses > 1 else None
+
+    # Write out the examples and targets.
+    LOGGER.info("Now writing out TFRecord files.")
+    examplesPerShard = config.get_param(["DataProcessing", "ExamplesPerShard"])[1]  # Examples to put in a shard.
+    variableNumbers = (0, 0)  # The number of example and target variables.
+
+    # If anything goes wrong while sharding, the worker processes are terminated rather than left running, and the
+    # partially written files are discarded.
+    isSharded = False
+    try:
+        with open(fileExamples, 'rb') as fidExamples, \
+                open(fileTargets if fileTargets else os.devnull, 'rb') as fidTargets:
+            # The input files are read through once from start to finish, so let the kernel read ahead
+            # aggressively.
+            _advise_file(fidExamples.fileno(), "POSIX_FADV_SEQUENTIAL")
+            _advise_file(fidTargets.fileno(), "POSIX_FADV_SEQUENTIAL")
+
+            # Strip headers.
+            exampleLines = _read_lines(fidExamples)
+            targetLines = _read_lines(fidTargets)
+            if exampleHeaderPresent:
+                next(exampleLines, None)
+            if targetHeaderPresent:
+                next(targetLines, None)
+
+            # Serialise the chunks of lines.
+            chunks = _chunk_lines(izip_longest(exampleLines, targetLines, fillvalue=''), SERIALISE_CHUNK_SIZE)
+            if pool:
+                serialisedChunks = _map_in_order(pool, _serialise_in_worker, chunks, 2 * numberProcesses)
+            else:
+                serialisedChunks = (serialise(i) for i in chunks)
+
+            # Write each example/target to the file of the dataset portion that it goes to. The writers are indexed
+            # by the portion, with examples/targets in portion 3 not going to any of the sets.
+            writers = [fidTrainingShard, fidTest, fidValidation]
+            for examples, variableNumbers in serialisedChunks:
+                for example in examples:
+                    split = next(splits)
+                    if split < 3:
+                        writers[split].write(example)
+
+                    # Open a new shard file if needed.
+                    if split == 0:
+                        examplesAddedToShard += 1
+                        if examplesAddedToShard == examplesPerShard:
+                            # As every full shard holds the same number of examples, the size of the shard just
+                            # completed is used as the amount of space to reserve for the next one.
+                            fidTrainingShard.close()
+                            fileCompletedShard = os.path.join(
+                                dirTrainData, "Shard_{:d}".format(currentFileNumber)
                             )
-                        }
-                    )
-                )
-                fidTest.write(example.SerializeToString())
-            elif choice[2]:
-                # The example/target will go to the validation set.
-
-                # Create the Example protocol buffer for the example
-                # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/example.proto).
-                example = tf.train.Example(
-                    # The Example protocol buffer contains a Features protocol buffer
-                    # (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/feature.proto).
-                    features=tf.train.Features(
-                        # The Features protocol buffer contains a list of features, which are one of either a
-                        # bytes_list, float_list or int64_list.
-                        feature={
-                            "Example": _float_feature(exampleDatapoint[2] if isExamplesBOW else exampleDatapoint),
-                            "ExampleIndices": _int64_feature(exampleDatapoint[1] if isExamplesBOW else []),
-                            "NumExampleVars": _int64_feature(
-                                [exampleDatapoint[0]] if isExamplesBOW else [len(exampleDatapoint)]
-                            ),
-                            "Target": _float_feature(targetDatapoint[2] if isTargetsBOW else targetDatapoint),
-                            "TargetIndices": _int64_feature(targetDatapoint[1] if isTargetsBOW else []),
-                            "NumTargetVars": _int64_feature(
-                                [targetDatapoint[0]] if isTargetsBOW else [len(targetDatapoint)]
+                            examplesAddedToShard = 0
+                            currentFileNumber += 1
+                            fidTrainingShard = _open_record_writer(
+                                os.path.join(dirTrainData, "Shard_{:d}".format(currentFileNumber)),
+                                os.path.getsize(fileCompletedShard)
                             )
-                        }
-                    )
-                )
-                fidValidation.write(example.SerializeToString())
+                            writers[0] = fidTrainingShard
+
+            # The input files won't be read again, so there is no point keeping them in the page cache.
+            _advise_file(fidExamples.fileno(), "POSIX_FADV_DONTNEED")
+            _advise_file(fidTargets.fileno(), "POSIX_FADV_DONTNEED")
+        isSharded = True
+    finally:
+        # Shut down the worker processes.
+        if pool:
+            if isSharded:
+                pool.close()
             else:
-                # The example/target will not go to any of the sets.
-                pass
-
-    # Determine number of example and target variables, and record this.
-    variableNumbers = {
-        "NumExampleVariables": exampleDatapoint[0] if isExamplesBOW else len(exampleDatapoint),
-        "NumTargetVariables": targetDatapoint[0] if isTargetsBOW else len(targetDatapoint)
-    }
+                pool.terminate()
+            pool.join()
+        if not isSharded:
+            for i in [fidTrainingShard, fidTest, fidValidation]:
+                i.discard()
+
+    # Record the number of example and target variables.
+    variableNumbers = {"NumExampleVariables": variableNumbers[0], "NumTargetVariables": variableNumbers[1]}
     fileNumVars = os.path.join(dirOutput, "NumVariables.json")
     fidNumVars = open(fileNumVars, 'w')
     json.dump(variableNumbers, fidNumVars)
@@ -246,13 +245,528 @@ def shard_vector(fileExamples, dirOutput, config, fileTargets=None):
     fidValidation.close()
 
 
-def _bytes_feature(value):
-    return tf.train.Feature(bytes_list=tf.train.BytesList(value=value))
+class _BufferedRecordWriter(object):
+    """Class for writing TFRecord files through a large user-space buffer.
+
+    The TFRecordWriter hands each record to the file as it is written, which means a write for every (typically small)
+    record. Here the framing of each record is done in Python, and the framed records are gathered in the buffer of the
+    file object so that they reach the file in large blocks. The records are written to a hidden temporary file that is
+    only renamed to the requested location once it has been closed, so an interrupted run never leaves a partial file
+    that looks complete (or that matches the Shard_* pattern the input pipeline reads). Each record is framed as
+    (https://www.tensorflow.org/api_guides/python/python_io#tfrecords_format_details):
+        uint64 length
+        uint32 masked_crc32_of_length
+        byte   data[length]
+        uint32 masked_crc32_of_data
+
+    """
+
+    def __init__(self, fileRecords, preallocateSize=0):
+        """Initialise a buffered TFRecord writer.
+
+        :param fileRecords:     The location of the file to write the records to.
+        :type fileRecords:      str
+        :param preallocateSize: The number of bytes of disk space to reserve for the file up front (if supported).
+        :type preallocateSize:  int
+
+        """
+
+        self._fileRecords = fileRecords
+        self._fid = open(_temporary_location(fileRecords), 'wb', WRITE_BUFFER_SIZE)
+        self._isPreallocated = False
+        if preallocateSize > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self._fid.fileno(), 0, preallocateSize)
+                self._isPreallocated = True
+            except OSError:
+                # Not all file systems support preallocation.
+                pass
+
+    def close(self):
+        """Flush any buffered records and close the file, dropping any reserved space that wasn't written to."""
+
+        if self._isPreallocated:
+            self._fid.truncate()
+        self._fid.close()
+        os.rename(self._fid.name, self._fileRecords)
+
+    def discard(self):
+        """Close the file and remove it rather than renaming it to the requested location."""
+
+        if not self._fid.closed:
+            self._fid.close()
+        try:
+            os.remove(self._fid.name)
+        except OSError:
+            # The file has already been closed (and renamed) or removed.
+            pass
+
+    def write(self, record):
+        """Write a record to the file.
+
+        :param record:  The record to write.
+        :type record:   bytes
+
+        """
+
+        length = _RECORD_LENGTH_STRUCT.pack(len(record))
+        self._fid.write(b"".join([
+            length, _RECORD_CRC_STRUCT.pack(_masked_crc32c(length)),
+            record, _RECORD_CRC_STRUCT.pack(_masked_crc32c(record))
+        ]))
+
+
+class _TensorflowRecordWriter(object):
+    """Class for writing TFRecord files with TensorFlow's own writer.
+
+    The records are written to a hidden temporary file that is only renamed to the requested location once it has been
+    closed, in the same way as with a _BufferedRecordWriter.
+
+    """
+
+    def __init__(self, fileRecords):
+        """Initialise a TensorFlow TFRecord writer.
+
+        :param fileRecords:     The location of the file to write the records to.
+        :type fileRecords:      str
+
+        """
+
+        self._fileRecords = fileRecords
+        self._fileTemporary = _temporary_location(fileRecords)
+        self._isClosed = False
+        self._writer = tf.python_io.TFRecordWriter(self._fileTemporary)
+
+    def close(self):
+        """Close the file and rename it to the requested location."""
+
+        self._writer.close()
+        self._isClosed = True
+        os.rename(self._fileTemporary, self._fileRecords)
+
+    def discard(self):
+        """Close the file and remove it rather than renaming it to the requested location."""
+
+        if not self._isClosed:
+            self._writer.close()
+            self._isClosed = True
+        try:
+            os.remove(self._fileTemporary)
+        except OSError:
+            # The file has already been closed (and renamed) or removed.
+            pass
+
+    def write(self, record):
+        """Write a record to the file.
+
+        :param record:  The record to write.
+        :type record:   bytes
+
+        """
+
+        self._writer.write(record)
+
+
+def _chunk_lines(lines, chunkSize):
+    """Group lines into chunks.
+
+    :param lines:       The lines to group.
+    :type lines:        iterable
+    :param chunkSize:   The number of lines to put in each chunk.
+    :type chunkSize:    int
+    :return:            The chunks of lines.
+    :rtype:             list
+
+    """
+
+    while True:
+        chunk = list(itertools.islice(lines, chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _generate_splits(choices, randomState, chunkSize=SPLIT_CHUNK_SIZE):
+    """Generate the dataset portion that each successive example/target should go to.
+
+    The portions are determined a chunk at a time, with the random values for a whole chunk drawn and compared against
+    the cumulative fractions at once. The portion is given by the number of cumulative fractions that the random value
+    is not less than (0 = training, 1 = test, 2 = validation and 3 = no portion).
+
+    :param choices:     The cumulative fractions of the training, test and validation portions.
+    :type choices:      list
+    :param randomState: The random number generator to use.
+    :type randomState:  np.random.RandomState
+    :param chunkSize:   The number of portions to determine at once.
+    :type chunkSize:    int
+    :return:            The portion of each example/target.
+    :rtype:             int
+
+    """
+
+    choices = np.asarray(choices)
+    while True:
+        for i in np.searchsorted(choices, randomState.random_sample(chunkSize), side="right").tolist():
+            yield i
+
+
+def _initialise_worker(serialise):
+    """Initialise a worker process with the function it uses to serialise lines of examples and targets.
+
+    Setting the function once when the worker starts means that the normalisers it uses are only sent to the worker
+    once, rather than with every chunk of lines.
+
+    :param serialise:   The function to serialise chunks of lines with.
+    :type serialise:    functools.partial
+
+    """
+
+    global _WORKER_SERIALISE
+    _WORKER_SERIALISE = serialise
+
+
+def _map_in_order(pool, func, iterable, maxPending):
+    """Apply a function to each item of an iterable using a pool of processes, and generate the results in order.
+
+    Unlike Pool.imap, at most maxPending items are read from the iterable ahead of the result being generated, so that
+    a large input file isn't read into memory faster than it can be processed.
+
+    :param pool:        The pool of worker processes.
+    :type pool:         multiprocessing.Pool
+    :param func:        The function to apply.
+    :type func:         function
+    :param iterable:    The items to apply the function to.
+    :type iterable:     iterable
+    :param maxPending:  The maximum number of items being processed at once.
+    :type maxPending:   int
+    :return:            The results of applying the function to each item.
+    :rtype:             object
+
+    """
+
+    pending = collections.deque()
+    for i in iterable:
+        pending.append(pool.apply_async(func, (i,)))
+        if len(pending) >= maxPending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
 
 
-def _float_feature(value):
-    return tf.train.Feature(float_list=tf.train.FloatList(value=value))
+def _read_lines(fid, blockSize=READ_BUFFER_SIZE):
+    """Read the lines of a file through a memory map of it.
+
+    Rather than iterating over the file a line at a time, the lines are found a block of the file at a time, with each
+    block ending on the last newline in it. Under Python 3 each block is decoded using the same encoding that open
+    would use to read the file as text. The newlines are not included in the lines. As the file is only read through
+    once, the pages of each block are released once all its lines have been consumed.
+
+    :param fid:         The file to read the lines of (opened in binary mode).
+    :type fid:          file
+    :param blockSize:   The (approximate) number of bytes to split into lines at a time.
+    :type blockSize:    int
+    :return:            The lines of the file.
+    :rtype:             str
+
+    """
+
+    fileSize = os.fstat(fid.fileno()).st_size
+    if not fileSize:
+        # Empty files (and special files like os.devnull) can't be memory mapped.
+        return
+    encoding = locale.getpreferredencoding(False) if sys.version_info[0] >= 3 else None
+    newline = "\n" if encoding else b"\n"
+
+    mappedFile = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(mappedFile, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mappedFile.madvise(mmap.MADV_SEQUENTIAL)
+
+        blockStart = 0
+        while blockStart < fileSize:
+            # End the block after its last newline. A line longer than the block is kept whole by ending the block
+            # after the first newline following it (or at the end of the file).
+            blockEnd = mappedFile.rfind(b"\n", blockStart, blockStart + blockSize) + 1
+            if not blockEnd:
+                blockEnd = mappedFile.find(b"\n", blockStart + blockSize) + 1 or fileSize
+            block = mappedFile[blockStart:blockEnd]
+            if encoding:
+                block = block.decode(encoding)
+            lines = block.split(newline)
+            if block.endswith(newline):
+                lines.pop()
+            for i in lines:
+                yield i
+
+            # The block has been fully consumed, so release its pages from both the memory map and the page cache
+            # rather than leaving them to be evicted once the whole file has been read. The release has to start on a
+            # page boundary.
+            pageStart = blockStart - (blockStart % mmap.PAGESIZE)
+            if hasattr(mappedFile, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+                mappedFile.madvise(mmap.MADV_DONTNEED, pageStart, blockEnd - pageStart)
+            _advise_file(fid.fileno(), "POSIX_FADV_DONTNEED", pageStart, blockEnd - pageStart)
+            blockStart = blockEnd
+    finally:
+        mappedFile.close()
+
+
+def _serialise_in_worker(lines):
+    """Serialise a chunk of lines of examples and targets in a worker process.
+
+    :param lines:   The pairs of example and target lines to serialise.
+    :type lines:    list
+    :return:        The serialised Examples and the number of example and target variables.
+    :rtype:         tuple
+
+    """
+
+    return _WORKER_SERIALISE(lines)
+
+
+def _serialise_lines(lines, exampleNormaliser, exampleSeparator, isExamplesBOW, targetNormaliser, targetSeparator,
+                     isTargetsBOW):
+    """Normalise and serialise a chunk of lines of examples and targets.
+
+    :param lines:               The pairs of example and target lines to serialise.
+    :type lines:                list
+    :param exampleNormaliser:   The normaliser for the examples.
+    :type exampleNormaliser:    DataNormalisation.BaseNormaliser
+    :param exampleSeparator:    The separator between the variables in an example line.
+    :type exampleSeparator:     str
+    :param isExamplesBOW:       Whether the examples are in a bag-of-words format.
+    :type isExamplesBOW:        bool
+    :param targetNormaliser:    The normaliser for the targets, or None if there are no targets.
+    :type targetNormaliser:     DataNormalisation.BaseNormaliser
+    :param targetSeparator:     The separator between the variables in a target line.
+    :type targetSeparator:      str
+    :param isTargetsBOW:        Whether the targets are in a bag-of-words format.
+    :type isTargetsBOW:         bool
+    :return:                    The serialised Examples and the number of example and target variables in the last
+                                line.
+    :rtype:                     tuple
+
+    """
+
+    # Normalise the data.
+    exampleDatapoints = [exampleNormaliser.normalise((i.strip()).split(exampleSeparator)) for i, _ in lines]
+    targetDatapoints = [
+        [] if not targetNormaliser else targetNormaliser.normalise((j.strip()).split(targetSeparator)) for _, j in lines
+    ]
+
+    # Pack the float values of all the datapoints in the chunk.
+    examplePayloads = _pack_float_rows([i[2] for i in exampleDatapoints] if isExamplesBOW else exampleDatapoints)
+    targetPayloads = _pack_float_rows([i[2] for i in targetDatapoints] if isTargetsBOW else targetDatapoints)
+
+    # Create the serialised Example protocol buffers.
+    examples = []
+    for exampleDatapoint, examplePayload, targetDatapoint, targetPayload in \
+            zip(exampleDatapoints, examplePayloads, targetDatapoints, targetPayloads):
+        examples.append(_serialise_example({
+            "Example": _packed_float_feature(examplePayload),
+            "ExampleIndices": _int64_feature(exampleDatapoint[1] if isExamplesBOW else []),
+            "NumExampleVars": _int64_feature([exampleDatapoint[0]] if isExamplesBOW else [len(exampleDatapoint)]),
+            "Target": _packed_float_feature(targetPayload),
+            "TargetIndices": _int64_feature(targetDatapoint[1] if isTargetsBOW else []),
+            "NumTargetVars": _int64_feature([targetDatapoint[0]] if isTargetsBOW else [len(targetDatapoint)])
+        }))
+
+    # Determine number of example and target variables.
+    variableNumbers = (
+        exampleDatapoint[0] if isExamplesBOW else len(exampleDatapoint),
+        targetDatapoint[0] if isTargetsBOW else len(targetDatapoint)
+    )
+
+    return examples, variableNumbers
+
+
+def _advise_file(fileDescriptor, advice, offset=0, length=0):
+    """Advise the kernel about how an open file (or a region of it) is going to be accessed.
+
+    The advice is silently skipped on platforms that don't support posix_fadvise (e.g. Windows and macOS) and for files
+    that can't take advice (e.g. pipes).
+
+    :param fileDescriptor:  The descriptor of the open file.
+    :type fileDescriptor:   int
+    :param advice:          The name of the os module constant holding the advice (e.g. "POSIX_FADV_SEQUENTIAL").
+    :type advice:           str
+    :param offset:          The start of the region of the file that the advice is for.
+    :type offset:           int
+    :param length:          The length of the region of the file that the advice is for (0 meaning to the end).
+    :type length:           int
+
+    """
+
+    fadvise = getattr(os, "posix_fadvise", None)
+    adviceValue = getattr(os, advice, None)
+    if fadvise and adviceValue is not None:
+        try:
+            fadvise(fileDescriptor, offset, length, adviceValue)
+        except OSError:
+            # The advice is only a hint, so failing to give it isn't a problem.
+            pass
+
+
+def _packed_float_feature(payload):
+    # A FloatList holds its values packed as little-endian floats in field 1, and is field 2 of a Feature.
+    floatList = _encode_length_delimited(_FIELD_1_TAG, payload) if payload else b""
+    return _encode_length_delimited(_FIELD_2_TAG, floatList)
 
 
 def _int64_feature(value):
-    return tf.train.Feature(int64_list=tf.train.Int64List(value=value))
+    # An Int64List holds its values packed as varints in field 1, and is field 3 of a Feature. Negative values are
+    # encoded as their 64 bit two's complement.
+    payload = b"".join([_encode_varint(i & 0xFFFFFFFFFFFFFFFF) for i in value])
+    int64List = _encode_length_delimited(_FIELD_1_TAG, payload) if value else b""
+    return _encode_length_delimited(_FIELD_3_TAG, int64List)
+
+
+def _pack_float_rows(rows):
+    """Pack rows of float values into little-endian float32 bytes.
+
+    The values of all the rows are packed through a single float32 array, which is then sliced up into the bytes of
+    each row. This works the same whether the rows are all the same length (e.g. vector rows) or not (e.g. the values
+    of bag-of-words rows).
+
+    :param rows:    The rows of values to pack.
+    :type rows:     list
+    :return:        The packed bytes of each row.
+    :rtype:         list
+
+    """
+
+    packedValues = np.fromiter(itertools.chain.from_iterable(rows), dtype="<f4").tobytes()
+    packedRows = []
+    rowStart = 0
+    for i in rows:
+        rowEnd = rowStart + 4 * len(i)
+        packedRows.append(packedValues[rowStart:rowEnd])
+        rowStart = rowEnd
+    return packedRows
+
+
+def _encode_length_delimited(tag, payload):
+    """Encode a length-delimited protocol buffer field.
+
+    :param tag:     The encoded tag of the field.
+    :type tag:      bytes
+    :param payload: The payload of the field.
+    :type payload:  bytes
+    :return:        The encoded field.
+    :rtype:         bytes
+
+    """
+
+    return tag + _encode_varint(len(payload)) + payload
+
+
+def _encode_varint(value):
+    """Encode a non-negative integer as a protocol buffer varint.
+
+    :param value:   The integer to encode.
+    :type value:    int
+    :return:        The encoded integer.
+    :rtype:         bytes
+
+    """
+
+    if value < 0x80:
+        return _SINGLE_BYTE_VARINTS[value]
+
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _masked_crc32c(data):
+    """Calculate the masked CRC32C checksum of some data, as used in the framing of TFRecords.
+
+    :param data:    The data to calculate the checksum of.
+    :type data:     bytes
+    :return:        The masked checksum.
+    :rtype:         int
+
+    """
+
+    crc = google_crc32c.value(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def _open_record_writer(fileRecords, preallocateSize=0):
+    """Open a writer for a TFRecord file.
+
+    The records are written through a _BufferedRecordWriter when a compiled CRC32C implementation is available to
+    frame them with (google_crc32c uses the CPU's CRC32 instructions where they are available). Otherwise, including
+    when google_crc32c has fallen back to its pure Python implementation, TensorFlow's own writer is used. Either way
+    the file is written under a temporary name until it is closed. Only the preallocation of disk space is tied to the
+    buffered writer, as TensorFlow's writer truncates the file when it opens it.
+
+    :param fileRecords:     The location of the file to write the records to.
+    :type fileRecords:      str
+    :param preallocateSize: The number of bytes of disk space to reserve for the file up front (if supported).
+    :type preallocateSize:  int
+    :return:                The writer for the file.
+    :rtype:                 _BufferedRecordWriter or _TensorflowRecordWriter
+
+    """
+
+    if _IS_CRC32C_COMPILED:
+        return _BufferedRecordWriter(fileRecords, preallocateSize)
+    return _TensorflowRecordWriter(fileRecords)
+
+
+def _serialise_example(features):
+    """Serialise features into an Example protocol buffer.
+
+    The Example protocol buffer
+    (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/example.proto) contains a Features
+    protocol buffer in field 1
+    (https://github.com/tensorflow/tensorflow/blob/master/tensorflow/core/example/feature.proto), which maps feature
+    names to features. Rather than creating the protocol buffer objects and then serialising them, the serialised form
+    is written directly. Each entry in the map is a field 1 of the Features, and contains the feature name in its field
+    1 and the feature in its field 2.
+
+    :param features:    The serialised features of the example indexed by their names.
+    :type features:     dict
+    :return:            The serialised Example.
+    :rtype:             bytes
+
+    """
+
+    serialisedFeatures = b"".join([
+        _encode_length_delimited(_FIELD_1_TAG, _feature_name_prefix(i) + _encode_length_delimited(_FIELD_2_TAG, j))
+        for i, j in features.items()
+    ])
+    return _encode_length_delimited(_FIELD_1_TAG, serialisedFeatures)
+
+
+def _feature_name_prefix(featureName):
+    """Get the serialised feature name field that starts the entry for a feature in the Features map.
+
+    As the same few feature names are used for every example, their encodings are cached.
+
+    :param featureName: The name of the feature.
+    :type featureName:  str
+    :return:            The serialised feature name field.
+    :rtype:             bytes
+
+    """
+
+    if featureName not in _FEATURE_NAME_PREFIXES:
+        _FEATURE_NAME_PREFIXES[featureName] = _encode_length_delimited(_FIELD_1_TAG, featureName.encode("utf-8"))
+    return _FEATURE_NAME_PREFIXES[featureName]
+
+
+def _temporary_location(fileRecords):
+    """Determine the hidden temporary location that a TFRecord file is written to before being renamed into place.
+
+    :param fileRecords: The location of the file being written.
+    :type fileRecords:  str
+    :return:            The temporary location of the file.
+    :rtype:             str
+
+    """
+
+    return os.path.join(os.path.dirname(fileRecords), ".{:s}.tmp".format(os.path.basename(fileRecords)))
@@ -7,13 +7,17 @@ from Utilities import sparse_tensor_to_dense
 import tensorflow as tf
 
 
-def main(dirShardedFiles, config):
+def main(dirShardedFiles, config, numExampleVars=None, numTargetVars=None):
     """Create the input pipeline to read in examples and prepare them for training.
 
     :param dirShardedFiles:     The location of the directory containing the sharded files.
     :type dirShardedFiles:      str
     :param config:              The object containing the configuration parameters for the sharding.
     :type config:               JsonschemaManipulation.Configuration
+    :param numExampleVars:      The number of example variables, or None if it isn't known.
+    :type numExampleVars:       int
+    :param numTargetVars:       The number of target variables, or None if it isn't known.
+    :type numTargetVars:        int
     :return:                    The batched examples and targets.
     :rtype:                     Dense tensors of type tf.float32.
 
@@ -26,9 +30,10 @@ def main(dirShardedFiles, config):
     # Get the number of threads to use.
     numberThreads = config.get_param(["TensorflowParams", "NumberThreads"])[1]
 
-    # Create the node that shuffles filenames and places them in a queue for consumption by the input pipeline.
+    # Create the node that shuffles filenames and places them in a queue for consumption by the input pipeline. The
+    # shard files are already written, so they are found once here rather than by an operation in the graph.
     numberEpochs = config.get_param(["NetworkTraining", "NumberEpochs"])[1]
-    trainingFiles = tf.train.match_filenames_once("{:s}/TrainingData/Shard_*".format(dirShardedFiles))
+    trainingFiles = sorted(tf.gfile.Glob("{:s}/TrainingData/Shard_*".format(dirShardedFiles)))
     filenameQueue = tf.train.string_input_producer(trainingFiles, num_epochs=numberEpochs, shuffle=True)
 
     # Create the reader to read from the filename queue. In order to create mini-batches by reading from multiple files
@@ -36,9 +41,12 @@ def main(dirShardedFiles, config):
     # different files from the same epoch until all the files from the epoch have been started. Each reader returns a
     # record (key, value pair) from which we only want the value. As our batch joiner node expects a list of tuples
     # of tensors, we wrap each value tensor returned by a reader in a tuple (with the value tensor being the only
-    # element. Each value tensor is of type string (i.e. it is a serialised example).
+    # element. Each value tensor is of type string (i.e. it is a serialised example). Rather than reading a single
+    # record each time a reader is run, each reader reads up to a mini-batch of records at once. This cuts the number
+    # of reader and enqueue operations that need to be run per mini-batch from the batch size to (about) one.
+    batchSize = config.get_param(["NetworkTraining", "BatchSize"])[1]
     readers = [tf.TFRecordReader() for _ in range(numberThreads)]
-    serialisedExamples = [(i.read(filenameQueue)[1],) for i in readers]
+    serialisedExamples = [(i.read_up_to(filenameQueue, batchSize)[1],) for i in readers]
 
     # Create the example batcher using shuffle_batch_join in order to use the examples read from multiple files (rather
     # than using shuffle_batch and generating each mini-batch from a single file). The batcher takes in the
@@ -46,22 +54,29 @@ def main(dirShardedFiles, config):
     # Batcher capacity must be larger than min_after_dequeue, and the amount larger determines the maximum number of
     # examples prefetched. Recommendation - min_after_dequeue + (num_threads + a small safety margin) * batch_size.
     # min_after_dequeue defines how big a buffer the batch will be randomly sampled from. Larger will give better
-    # shuffling but slower start up and greater memory usage.
-    batchSize = config.get_param(["NetworkTraining", "BatchSize"])[1]
+    # shuffling but slower start up and greater memory usage. As the readers produce batches of serialised examples,
+    # they are enqueued as many individual examples.
     batcherMinAfterDequeue = config.get_param(["TensorflowParams", "BatcherMinAfterDequeue"])[1]
     batcherCapacity = config.get_param(["TensorflowParams", "BatcherCapacity"])[1]
     batcherCapacity = max(batcherCapacity, batcherMinAfterDequeue + (numberThreads + 2) * batchSize)
     batchedSerialisedExamples = tf.train.shuffle_batch_join(
-        serialisedExamples, batchSize, capacity=batcherCapacity, min_after_dequeue=batcherMinAfterDequeue
+        serialisedExamples, batchSize, capacity=batcherCapacity, min_after_dequeue=batcherMinAfterDequeue,
+        enqueue_many=True
     )
 
-    # Define the feature mapping used for decoding examples. As we don't know the number of variables in advance, we
-    # use VarLenFeature for everything except the single integer indicating the number of variables.
+    # Define the feature mapping used for decoding examples. When the examples/targets are vectors and the number of
+    # variables is known in advance, every example/target has the same number of values, and they can be parsed
+    # directly into a dense tensor with FixedLenFeature. Otherwise, we use VarLenFeature for everything except the
+    # single integer indicating the number of variables.
+    isExamplesDense = not isExamplesBOW and numExampleVars is not None
+    isTargetsDense = not isTargetsBOW and numTargetVars is not None
     featureTypes = {
-        "Example": tf.VarLenFeature(dtype=tf.float32),
+        "Example": (tf.FixedLenFeature([numExampleVars], dtype=tf.float32) if isExamplesDense else
+                    tf.VarLenFeature(dtype=tf.float32)),
         "ExampleIndices": tf.VarLenFeature(dtype=tf.int64),
         "NumExampleVars": tf.FixedLenFeature([1], dtype=tf.int64),
-        "Target": tf.VarLenFeature(dtype=tf.float32),
+        "Target": (tf.FixedLenFeature([numTargetVars], dtype=tf.float32) if isTargetsDense else
+                   tf.VarLenFeature(dtype=tf.float32)),
         "TargetIndices": tf.VarLenFeature(dtype=tf.int64),
         "NumTargetVars": tf.FixedLenFeature([1], dtype=tf.int64)
     }
@@ -73,22 +88,20 @@ def main(dirShardedFiles, config):
     # Convert sparse tensors to dense tensors. As bag-of-words representations may not all have the same number of
     # values, converting their sparse tensors directly to dense ones necessitates filling in default values. This
     # makes converting from the bag-of-words to a dense vector representation more complicated than if the sparse
-    # tensor is used directly.
+    # tensor is used directly. Examples/targets parsed with FixedLenFeature are already dense.
+    batchExamples = parsedBatch["Example"]
     if isExamplesBOW:
-        parsedBatch["Example"] = sparse_tensor_to_dense.main(
-            parsedBatch["Example"], parsedBatch["ExampleIndices"], parsedBatch["NumExampleVars"][0, 0]
+        batchExamples = sparse_tensor_to_dense.main(
+            batchExamples, parsedBatch["ExampleIndices"], parsedBatch["NumExampleVars"][0, 0]
         )
-    else:
-        parsedBatch["Example"] = tf.sparse_tensor_to_dense(parsedBatch["Example"])
+    elif not isExamplesDense:
+        batchExamples = tf.sparse_tensor_to_dense(batchExamples)
+    batchTargets = parsedBatch["Target"]
     if isTargetsBOW:
-        parsedBatch["Target"] = sparse_tensor_to_dense.main(
-            parsedBatch["Target"], parsedBatch["TargetIndices"], parsedBatch["NumTargetVars"][0, 0]
+        batchTargets = sparse_tensor_to_dense.main(
+            batchTargets, parsedBatch["TargetIndices"], parsedBatch["NumTargetVars"][0, 0]
         )
-    else:
-        parsedBatch["Target"] = tf.sparse_tensor_to_dense(parsedBatch["Target"])
-
-    # Split into batches of examples and targets.
-    batchExamples = parsedBatch["Example"]
-    batchTargets = parsedBatch["Target"]
+    elif not isTargetsDense:
+        batchTargets = tf.sparse_tensor_to_dense(batchTargets)
 
     return batchExamples, batchTargets
@@ -3,7 +3,6 @@
 # Python imports.
 import logging
 import math
-import random
 
 # 3rd party imports.
 import numpy as np
@@ -11,6 +10,8 @@ import tensorflow as tf
 
 # Globals.
 LOGGER = logging.getLogger(__name__)
+ACTIVATION_FUNCS = {"relu": tf.nn.relu, "sigmoid": tf.nn.sigmoid}  # Non-linear activations, any other is linear.
+NOISE_SEED_OFFSET = 1  # The offset added to the configured random seed to get the seed for the noise mask.
 
 
 def evaluation():
@@ -34,53 +35,91 @@ def inference(examples, numExampleVars, config):
     # Extract the information about the layers of the network from the configuration file.
     networkLayers = config.get_param(["Network", "Layers"])[1]
 
-    # Corrupt the input with noise.
+    # Corrupt the input with noise. The random values for the whole mask are drawn at once. The configured seed is
+    # offset so that the mask doesn't replay the random values used to split the data when it was sharded, and as numpy
+    # only accepts seeds in [0, 2**32), the (unbounded) offset seed is then reduced into that range.
     batchSize = int(config.get_param(["NetworkTraining", "BatchSize"])[1])
     noiseLevel = float(config.get_param(["Network", "Noise"])[1])
-    noiseMask = np.array([1.0 if (random.random() >= noiseLevel) else 0.0 for _ in range(batchSize * numExampleVars)])
-    noiseMask = noiseMask.reshape((batchSize, numExampleVars))
+    randomSeed = config.get_param(["RandomSeed"])
+    randomState = np.random.RandomState((randomSeed[1] + NOISE_SEED_OFFSET) % (2 ** 32) if randomSeed[0] else None)
+    noiseMask = (randomState.random_sample((batchSize, numExampleVars)) >= noiseLevel).astype(np.float32)
     noiseMask = tf.convert_to_tensor(noiseMask, dtype=tf.float32)
     noisyExamples = tf.multiply(examples, noiseMask)
 
-    # Create the non-input layers.
-    layerOutputs = {}
+    # Determine the type of the network's weights and activations. When using half precision, the output is cast back
+    # to single precision so that anything built on top of the network doesn't need to know about it.
+    useHalfPrecision = config.get_param(["TensorflowParams", "UseHalfPrecision"])
+    dtype = tf.float16 if useHalfPrecision[0] and useHalfPrecision[1] else tf.float32
+    noisyExamples = tf.cast(noisyExamples, dtype) if dtype != tf.float32 else noisyExamples
+
+    # Create the non-input layers. When requested (and available), the layers' operations are marked for compilation
+    # by XLA so that the matrix multiplication, bias addition and activation of each layer can be fused.
+    useXLA = config.get_param(["TensorflowParams", "UseXLA"])
+    useXLA = useXLA[0] and useXLA[1]
+    if useXLA:
+        # Only import contrib when XLA is wanted, as importing it is slow and pulls in many unrelated modules.
+        try:
+            from tensorflow.contrib.compiler import jit
+        except ImportError:
+            LOGGER.warning(
+                "XLA compilation was requested, but isn't available in this version of TensorFlow. Ignoring."
+            )
+            useXLA = False
+    if useXLA:
+        with jit.experimental_jit_scope():
+            outputs = _create_layers(noisyExamples, numExampleVars, networkLayers, dtype)
+    else:
+        outputs = _create_layers(noisyExamples, numExampleVars, networkLayers, dtype)
+    return tf.cast(outputs, tf.float32) if dtype != tf.float32 else outputs
+
+
+def loss():
+    pass
+
+
+def training():
+    pass
+
+
+def _create_layers(inputs, numInputNodes, networkLayers, dtype=tf.float32):
+    """Create the non-input layers of the network.
+
+    :param inputs:          The tensor that is input to the first defined layer.
+    :type inputs:           Dense tensor of type dtype
+    :param numInputNodes:   The number of nodes in the input.
+    :type numInputNodes:    int
+    :param networkLayers:   The configuration of each of the non-input layers.
+    :type networkLayers:    list
+    :param dtype:           The type of the weights and activations of the layers.
+    :type dtype:            tf.DType
+    :return:                The output of the final layer.
+    :rtype:                 Dense tensor of type dtype
+
+    """
+
+    prevLayerOutput = inputs
+    numSourceNodes = numInputNodes
     for i, j in enumerate(networkLayers):
         # Determine the number of nodes in the layer and the activation function to use.
         numNodesInLayer = j["NumberNodes"]
-        activationFunc = j["ActivationFunc"]
+        activationFunc = ACTIVATION_FUNCS.get(j["ActivationFunc"])
 
         # Create the weights and biases for the layer.
         with tf.name_scope("{:s}".format("output" if i == (len(networkLayers) - 1) else "hidden{:d}".format(i))):
             # Log the creation of the layer.
             LOGGER.info("Creating layer {:d} with {:d} nodes.".format(i, numNodesInLayer))
 
-            # Determine number of nodes and activations from the previous layer. If the current layer is the first
-            # defined layer, then the previous layer is the input examples.
-            numSourceNodes = numExampleVars if i == 0 else networkLayers[i - 1]["NumberNodes"]
-            prevLayerOutput = noisyExamples if i == 0 else layerOutputs[i - 1]
-
             # Create the weights, biases and outputs for the layer.
             weights = tf.Variable(
-                tf.truncated_normal([numSourceNodes, numNodesInLayer], stddev=1.0 / math.sqrt(float(numNodesInLayer))),
+                tf.truncated_normal(
+                    [numSourceNodes, numNodesInLayer], stddev=1.0 / math.sqrt(float(numNodesInLayer)), dtype=dtype
+                ),
                 name="weights"
             )
-            biases = tf.Variable(tf.zeros([numNodesInLayer]), name="biases")
-            if activationFunc == "relu":
-                outputs = tf.nn.relu(tf.matmul(prevLayerOutput, weights) + biases)
-            elif activationFunc == "sigmoid":
-                outputs = tf.nn.sigmoid(tf.matmul(prevLayerOutput, weights) + biases)
-            else:
-                # Linear activation.
-                outputs = tf.matmul(prevLayerOutput, weights) + biases
-            layerOutputs[i] = outputs
-
-    # Return the output layer.
-    return layerOutputs[len(networkLayers) - 1]
-
+            biases = tf.Variable(tf.zeros([numNodesInLayer], dtype=dtype), name="biases")
+            prevLayerOutput = tf.nn.bias_add(tf.matmul(prevLayerOutput, weights), biases)
+            if activationFunc:
+                prevLayerOutput = activationFunc(prevLayerOutput)
+            numSourceNodes = numNodesInLayer
 
-def loss():
-    pass
-
-
-def training():
-    pass
+    return prevLayerOutput
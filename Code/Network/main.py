@@ -31,9 +31,8 @@ def main_vector(dirData, config):
 
     # Determine the number of example and target variables.
     fileNumVars = os.path.join(dirProcessedData, "NumVariables.json")
-    fidNumVars = open(fileNumVars, 'r')
-    numberVariables = json.load(fidNumVars)
-    fidNumVars.close()
+    with open(fileNumVars, 'r') as fidNumVars:
+        numberVariables = json.loads(fidNumVars.read())
     numExampleVars = numberVariables["NumExampleVariables"]
     numTargetVars = numberVariables["NumTargetVariables"]
 
@@ -45,7 +44,7 @@ def main_vector(dirData, config):
 
         # Setup the input pipeline that generates mini-batches.
         LOGGER.info("Now setting up the input pipeline.")
-        batchExamples, batchTargets = InputPipeline.vector.main(dirProcessedData, config)
+        batchExamples, batchTargets = InputPipeline.vector.main(dirProcessedData, config, numExampleVars, numTargetVars)
 
         # Setup the network structure. The network is built in a four stage approach:
         #   1) inference()  - This operation will build the graph as far as is needed to make predictions (i.e. up to
@@ -6,6 +6,7 @@ import json
 import logging.config
 import os
 import shutil
+import stat
 import sys
 
 # User imports.
@@ -91,7 +92,8 @@ else:
 # the location of the file that the logs are written to.
 fileLoggerConfig = os.path.join(dirTop, "ConfigurationFiles", "Loggers.json")
 fileLogOutput = os.path.join(dirOutput, "Logs.log")
-logConfigInfo = json.load(open(fileLoggerConfig, 'r'))
+with open(fileLoggerConfig, 'r') as fidLoggerConfig:
+    logConfigInfo = json.loads(fidLoggerConfig.read())
 logConfigInfo["handlers"]["file"]["filename"] = fileLogOutput
 logging.config.dictConfig(logConfigInfo)
 logger = logging.getLogger("__main__")
@@ -224,21 +226,29 @@ isProcessing = False
 if not args.noProcess and config.get_param(["DataProcessing"])[0]:
     isProcessing = True
 
-# Validate the input data.
+# Validate the input data. The location is only stat'd once, rather than once for each of the existence, file and
+# directory checks.
 inputData = args.input
-if not os.path.exists(inputData):
+try:
+    inputMode = os.stat(inputData).st_mode
+except OSError:
     logger.error("The location containing the input data does not exist.")
+    inputMode = 0
     isErrors = True
-if isProcessing and (not os.path.isfile(inputData)):
+if isProcessing and (not stat.S_ISREG(inputMode)):
     logger.error("The input dataset to be processed is not a file.")
     isErrors = True
-elif (not isProcessing) and (not os.path.isdir(inputData)):
+elif (not isProcessing) and (not stat.S_ISDIR(inputMode)):
     logger.error("No processing is selected. The input data should therefore be a directory, but isn't.")
     isErrors = True
 
 # Validate the file of targets.
 if args.target:
-    if not os.path.isfile(args.target):
+    try:
+        targetMode = os.stat(args.target).st_mode
+    except OSError:
+        targetMode = 0
+    if not stat.S_ISREG(targetMode):
         logger.error("The supplied location of the file of example targets is not a file.")
         isErrors = True
 